@@ -6,6 +6,10 @@ from typing import List
 
 from hooks.utils import StaticAnalyzerCmd
 
+# Summary lines like `1 warning generated.` that clang-tidy prints for a translation unit.
+# Only the singular form matches; plural `N warnings generated.` lines are left in the output.
+WARNINGS_GENERATED_RE = re.compile(rb"[\d,]+ warning \S+\s+")
+
 
 class ClangTidyCmd(StaticAnalyzerCmd):
     """Class for the clang-tidy command."""
@@ -20,10 +24,11 @@ class ClangTidyCmd(StaticAnalyzerCmd):
 
     def run(self):
         """Run clang-tidy. If --fix-errors is passed in, then return code will be 0, even if there are errors."""
+        # One process per file: without -p, clang-tidy finds the compilation database from the first file's path
         for filename in self.files:
             self.run_command([filename] + self.args)
             # Warnings generated aren't important.
-            self.stderr = re.sub(rb"[\d,]+ warning \S+\s+", b"", self.stderr)
+            self.stderr = WARNINGS_GENERATED_RE.sub(b"", self.stderr)
             if len(self.stderr) > 0 and "--fix-errors" in self.args:
                 self.returncode = 1
             self.exit_on_error()
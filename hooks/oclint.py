@@ -3,6 +3,7 @@
 import os
 import sys
 from typing import List
+from typing import Set
 
 from hooks.utils import StaticAnalyzerCmd
 
@@ -35,7 +36,7 @@ class OCLintCmd(StaticAnalyzerCmd):
         """Run OCLint and remove generated temporary files. OCLint will put the standard reprot into stderr."""
         # Split text into an array of args that can be passed into oclint
         for filename in self.files:
-            current_files = os.listdir(os.getcwd())
+            current_files = set(os.listdir(os.getcwd()))
             self.run_command([filename] + self.args)
             # Errors are sent to stdout instead of stderr
             if b"Errors" in self.stdout:
@@ -46,7 +47,7 @@ class OCLintCmd(StaticAnalyzerCmd):
             self.cleanup_files(current_files)
 
     @staticmethod
-    def cleanup_files(existing_files: List[str]):
+    def cleanup_files(existing_files: Set[str]):
         """Delete the plist files that oclint generates."""
         new_files = os.listdir(os.getcwd())
         for filename in new_files:
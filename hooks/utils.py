@@ -1,12 +1,21 @@
 #!/usr/bin/env python
 """fns for clang-format, clang-tidy, oclint"""
 import difflib
+import functools
 import os
 import re
 import shutil
 import subprocess as sp
 import sys
 from typing import List
+from typing import Optional
+
+
+@functools.lru_cache(maxsize=None)
+def get_version_output(command: str) -> str:
+    """Get the output of `command --version`. It won't change while a hook runs, so only probe once per command."""
+    sp_child = sp.run([command, "--version"], stdout=sp.PIPE, stderr=sp.DEVNULL)
+    return str(sp_child.stdout, encoding="utf-8")
 
 
 class Command:
@@ -17,7 +26,7 @@ class Command:
         self.look_behind = look_behind
         self.command = command
         # Will be [] if not run using pre-commit or if there are no committed files
-        self.files = self.get_added_files()
+        self.files = self.get_added_files(args)
         self.edit_in_place = False
 
         self.stdout = b""
@@ -35,9 +44,10 @@ class Command:
             )  # noqa: E501
             self.raise_error(problem, details)
 
-    def get_added_files(self):
-        """Find added files using git."""
-        added_files = sys.argv[1:]  # 1: don't include the hook file
+    def get_added_files(self, args: Optional[List[str]] = None):
+        """Find added files using git. args defaults to sys.argv."""
+        args = sys.argv if args is None else args
+        added_files = args[1:]  # 1: don't include the hook file
         # cfg files are used by uncrustify and won't be source files
         added_files = [f for f in added_files if os.path.exists(f) and not f.endswith(".cfg")]
 
@@ -115,9 +125,7 @@ Edit your pre-commit config or use a different version of {}.""".format(
 
     def get_version_str(self):
         """Get the version string like 8.0.0 for a given command."""
-        args = [self.command, "--version"]
-        sp_child = sp.run(args, stdout=sp.PIPE, stderr=sp.PIPE)
-        version_str = str(sp_child.stdout, encoding="utf-8")
+        version_str = get_version_output(self.command)
         # After version like `8.0.0` is expected to be '\n' or ' '
         regex = self.look_behind + r"((?:\d+\.)+[\d+_\+\-a-z]+)"
         search = re.search(regex, version_str)
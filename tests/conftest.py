@@ -12,25 +12,37 @@ def pytest_exception_interact(node, call, report):
     """See https://docs.pytest.org/en/latest/reference.html#_pytest.hookspec.pytest_exception_interact"""  # noqa: E501
     if report.failed:
         # Clean up temp dirs in tests/test_repo if a test failed.
-        if os.path.exists("tests/test_repo/temp"):
-            shutil.rmtree("tests/test_repo/temp")
+        test_repo_temp = os.path.join(os.path.dirname(os.path.abspath(__file__)), "test_repo", "temp")
+        if os.path.exists(test_repo_temp):
+            shutil.rmtree(test_repo_temp)
         # Delete generated files
         for filename in ["ok.plist", "err.plist", "defaults.cfg"]:
-            abs_filename = os.path.abspath(filename)
-            if os.path.exists(abs_filename):
-                os.remove(abs_filename)
+            try:
+                os.remove(os.path.abspath(filename))
+            except FileNotFoundError:
+                pass
 
 
 def pytest_generate_tests(metafunc):
     """Taken from pytest documentation to allow for table tests:
     https://docs.pytest.org/en/latest/example/parametrize.html#paramexamples"""
-    metafunc.cls.setup_class()
-    idlist = []
-    argvalues = []
-    argnames = []
-    for scenario in metafunc.cls.scenarios:
-        idlist.append(scenario[0])
-        items = scenario[1].items()
-        argnames = [x[0] for x in items]
-        argvalues.append([x[1] for x in items])
+    # Module-level tests use pytest.mark.parametrize instead of a scenarios list
+    if not hasattr(metafunc.cls, "setup_class"):
+        return
+    cls = metafunc.cls
+    # Built once per class; every test method in the class shares the same scenarios
+    if "parametrize_args" not in cls.__dict__:
+        cls.setup_class()
+        idlist = []
+        argvalues = []
+        argnames = []
+        for scenario in cls.scenarios:
+            idlist.append(scenario[0])
+            items = scenario[1].items()
+            argnames = [x[0] for x in items]
+            # An optional third element holds marks for the scenario, like pytest.mark.oclint
+            marks = scenario[2] if len(scenario) > 2 else ()
+            argvalues.append(pytest.param(*[x[1] for x in items], marks=marks))
+        cls.parametrize_args = (argnames, argvalues, idlist)
+    argnames, argvalues, idlist = cls.parametrize_args
     metafunc.parametrize(argnames, argvalues, ids=idlist, scope="class")
@@ -1,23 +1,28 @@
 """Test oclint and clang-tidy -p argument"""
 import os
+import shutil
+
+import pytest
 
 from hooks.clang_tidy import ClangTidyCmd
 from hooks.oclint import OCLintCmd
 
+dashp_klasses = [ClangTidyCmd]
+if os.name != "nt":  # oclint doesn't exist on windows
+    dashp_klasses.append(OCLintCmd)
+dashp_params = [
+    pytest.param(
+        klass,
+        id=klass.__name__,
+        marks=pytest.mark.skipif(shutil.which(klass.command) is None, reason=f"{klass.command} is not installed"),
+    )
+    for klass in dashp_klasses
+]
 
-class TestHDashp:
-    """Deal with the conftest weirdness"""
-
-    @classmethod
-    def setup_class(cls):
-        """Setup the scenario list"""
-        cls.scenarios = [["ClangTidyCmd", {"klass": ClangTidyCmd}]]
-        if os.name != "nt":  # oclint doesn't exist on windows
-            cls.scenarios.append(["OCLintCmd", {"klass": OCLintCmd}])
 
-    @staticmethod
-    def test_clang_tidy_dashp_present(klass) -> None:
-        """If -p is in arguments make sure -DCMAKE_EXPORT_COMPILE_COMMANDS is *not*"""
-        checker = klass(["-p=cmake-build-debug"])
-        for arg in checker.args:
-            assert not arg.startswith("-DCMAKE_EXPORT_COMPILE_COMMANDS")
+@pytest.mark.parametrize("klass", dashp_params)
+def test_clang_tidy_dashp_present(klass) -> None:
+    """If -p is in arguments make sure -DCMAKE_EXPORT_COMPILE_COMMANDS is *not*"""
+    checker = klass(["-p=cmake-build-debug"])
+    for arg in checker.args:
+        assert not arg.startswith("-DCMAKE_EXPORT_COMPILE_COMMANDS")
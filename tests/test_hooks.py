@@ -15,9 +15,9 @@ functionally tests the same thing.
 """
 import json
 import os
-import re
 import subprocess as sp
-import tempfile
+
+import pytest
 
 import tests.test_utils as utils
 from hooks.clang_format import ClangFormatCmd
@@ -28,6 +28,13 @@ from hooks.include_what_you_use import IncludeWhatYouUseCmd
 from hooks.oclint import OCLintCmd
 from hooks.uncrustify import UncrustifyCmd
 
+# Args that make a command rewrite its input files
+EDIT_IN_PLACE_ARGS = {
+    "clang-format": frozenset(["-i"]),
+    "clang-tidy": frozenset(["-fix", "--fix-errors"]),
+    "uncrustify": frozenset(["--replace"]),
+}
+
 
 class GeneratorT:
     """Generate the test scenarios"""
@@ -47,16 +54,20 @@ class GeneratorT:
         +2x tests:
             * Call the shell hooks installed with pip to mimic end user use
             * Call via importing the command classes to verify expectations"""
-        test_repo_dir = os.path.join(os.getcwd(), "tests", "test_repo")
+        test_repo_dir = utils.TEST_REPO_DIR
+        # Specify config file as autogenerated one varies between uncrustify versions.
+        # v0.66 on ubuntu creates an invalid config; v0.68 on osx does not.
+        cls.unc_defaults_path = os.path.join(utils.TESTS_DIR, "uncrustify_defaults.cfg")
         cls.err_c = os.path.join(test_repo_dir, "err.c")
         cls.err_cpp = os.path.join(test_repo_dir, "err.cpp")
         cls.ok_c = os.path.join(test_repo_dir, "ok.c")
         cls.ok_cpp = os.path.join(test_repo_dir, "ok.cpp")
         cls.files = [cls.ok_c, cls.ok_cpp, cls.err_c, cls.err_cpp]
+        cls.err_files = [cls.err_c, cls.err_cpp]
         cls.retcodes = [0, 0, 1, 1]
 
         cls.scenarios = []
-        cls.scenarios += cls.get_multifile_scenarios_no_diff([cls.err_c, cls.err_cpp])
+        cls.scenarios += cls.get_multifile_scenarios_no_diff()
         cls.scenarios += cls.generate_formatter_tests()
         cls.scenarios += cls.generate_clang_tidy_tests()
         cls.scenarios += cls.generate_cppcheck_tests()
@@ -67,6 +78,17 @@ class GeneratorT:
             # oclint does not work on windows
             cls.scenarios += cls.generate_oclint_tests()
 
+    @classmethod
+    def get_version(cls, cmd_name):
+        """Version of cmd_name, or "" if it isn't installed.
+        Scenarios for a missing tool are still generated so that TestHooks reports them as skipped."""
+        return cls.versions.get(cmd_name, "")
+
+    @classmethod
+    def render_outputs(cls, err_template, *format_args):
+        """Render an error template once per err file. Output is aligned with cls.files; ok files have no output."""
+        return [b"", b""] + [err_template.format(f, *format_args).encode() for f in cls.err_files]
+
     @classmethod
     def generate_formatter_tests(cls):
         """Tests for both uncrustify and clang-format. Both should generate the same error output."""
@@ -90,10 +112,7 @@ class GeneratorT:
         formatter_cpp_err = clang_format_err.format(cls.err_cpp, "<string>").encode()
         formatter_output = [b"", b"", formatter_c_err, formatter_cpp_err]
 
-        # Specify config file as autogenerated one varies between uncrustify versions.
-        # v0.66 on ubuntu creates an invalid config; v0.68 on osx does not.
-        unc_defaults_path = os.path.join(os.getcwd(), "tests", "uncrustify_defaults.cfg")
-        unc_base_args = ["-c", unc_defaults_path]
+        unc_base_args = ["-c", cls.unc_defaults_path]
         unc_addtnl_args = [[], ["--replace", "--no-backup"]]
         uncrustify_arg_sets = [unc_base_args + arg for arg in unc_addtnl_args]
 
@@ -107,13 +126,13 @@ class GeneratorT:
                 scenarios += [uncrustify_scenario]
         return scenarios
 
-    def get_multifile_scenarios_no_diff(err_files):
+    @classmethod
+    def get_multifile_scenarios_no_diff(cls):
         """Create tests to verify that commands are handling both err.c/err.cpp as input correctly and that --no-diff disables diff output."""
         expected_err = b""
-        unc_defaults_path = os.path.join(os.getcwd(), "tests", "uncrustify_defaults.cfg")
         scenarios = [
-            [ClangFormatCmd, ["--style=google", "--no-diff"], err_files, expected_err, 1],
-            [UncrustifyCmd, ["-c", unc_defaults_path, "--no-diff"], err_files, expected_err, 1],
+            [ClangFormatCmd, ["--style=google", "--no-diff"], cls.err_files, expected_err, 1],
+            [UncrustifyCmd, ["-c", cls.unc_defaults_path, "--no-diff"], cls.err_files, expected_err, 1],
         ]
         return scenarios
 
@@ -130,9 +149,7 @@ int main(){{int i;return;}}
 1 error generated.
 Error while processing {0}.
 """  # noqa: E501
-        clang_tidy_str_c = clang_tidy_err_str.format(cls.err_c, "").encode()
-        clang_tidy_str_cpp = clang_tidy_err_str.format(cls.err_cpp).encode()
-        clang_tidy_output = [b"", b"", clang_tidy_str_c, clang_tidy_str_cpp]
+        clang_tidy_output = cls.render_outputs(clang_tidy_err_str)
         scenarios = []
         for i in range(len(cls.files)):
             for arg_set in clang_tidy_args_sets:
@@ -143,6 +160,8 @@ Error while processing {0}.
                     # Clang tidy c++20 generates additional warnings
                 clang_tidy_scenario = [ClangTidyCmd, new_arg_set, [cls.files[i]], clang_tidy_output[i], cls.retcodes[i]]
                 scenarios += [clang_tidy_scenario]
+        # Each file gets its own clang-tidy process and the hook exits at the first failing file
+        scenarios += [[ClangTidyCmd, ct_base_args, cls.err_files, clang_tidy_output[2], 1]]
         return scenarios
 
     @classmethod
@@ -150,21 +169,20 @@ Error while processing {0}.
         cppcheck_arg_sets = [[]]
         # cppcheck adds unnecessary error information.
         # See https://stackoverflow.com/questions/6986033
-        if cls.versions["cppcheck"] <= "1.88":
+        cppcheck_version = cls.get_version("cppcheck")
+        if cppcheck_version <= "1.88":
             cppcheck_err = "[{}:1]: (style) Unused variable: i\n"
         # They've made changes to messaging
-        elif cls.versions["cppcheck"] >= "1.89":
+        elif cppcheck_version >= "1.89":
             cppcheck_err = """{}:2:16: style: Unused variable: i [unusedVariable]
 int main(){{int i;return;}}
                ^
 """
         else:
-            print("Problem parsing version for cppcheck", cls.versions["cppcheck"])
+            print("Problem parsing version for cppcheck", cppcheck_version)
             print("Please create an issue on github.com/pocc/pre-commit-hooks")
-            cppcheck_err = b""
-        cppcheck_err_c = cppcheck_err.format(cls.err_c).encode()
-        cppcheck_err_cpp = cppcheck_err.format(cls.err_cpp).encode()
-        cppcheck_output = [b"", b"", cppcheck_err_c, cppcheck_err_cpp]
+            cppcheck_err = ""
+        cppcheck_output = cls.render_outputs(cppcheck_err)
         scenarios = []
         for i in range(len(cls.files)):
             for arg_set in cppcheck_arg_sets:
@@ -184,9 +202,7 @@ Total errors found: 5
 {0}:2:  Missing space before {{  [whitespace/braces] [5]
 {0}:2:  Could not find a newline character at the end of the file.  [whitespace/ending_newline] [5]
 """
-        cpplint_err_c = cpplint_err_str.format(cls.err_c).encode()
-        cpplint_err_cpp = cpplint_err_str.format(cls.err_cpp).encode()
-        cpplint_output = [b"", b"", cpplint_err_c, cpplint_err_cpp]
+        cpplint_output = cls.render_outputs(cpplint_err_str)
         scenarios = []
         for i in range(len(cls.files)):
             for arg_set in cpplint_arg_sets:
@@ -258,19 +274,16 @@ Summary: TotalFiles=0 FilesWithViolations=0 P1=0 P2=0 P3=0{1}
         # -no-analytics required because in some versions of oclint, this causes oclint to hang (0.13.1)
         # version 20+ starts using --<option> instead of -<option>
         # Link is to https://oclint.org instead of http://oclint.org in versions >= 20
+        oclint_version = cls.get_version("oclint")
         https_s = ""
-        if cls.versions["oclint"] >= "20":
+        if oclint_version >= "20":
             oclint_arg_sets = [["--enable-global-analysis", "--enable-clang-static-analyzer"]]
             https_s = "s"
         else:
             oclint_arg_sets = [["-enable-global-analysis", "-enable-clang-static-analyzer", "-no-analytics"]]
         oclint_arg_sets[0] += ["--", "-std=c18"]
-        ver_output = sp.check_output(["oclint", "--version"]).decode("utf-8")
-        oclint_ver = re.search(r"OCLint version ([\d.]+)\.", ver_output).group(1)
         eol_whitespace = " "
-        oclint_err_str_c = oclint_err.format(cls.err_c, eol_whitespace, https_s, oclint_ver).encode()
-        oclint_err_str_cpp = oclint_err.format(cls.err_cpp, eol_whitespace, https_s, oclint_ver).encode()
-        oclint_output = [b"", b"", oclint_err_str_c, oclint_err_str_cpp]
+        oclint_output = cls.render_outputs(oclint_err, eol_whitespace, https_s, oclint_version)
         oclint_retcodes = [0, 0, 6, 6]
         for i in range(len(cls.files)):
             for arg_set in oclint_arg_sets:
@@ -300,24 +313,28 @@ class TestHooks:
 
         cls.run_cmd_class is redundant, but available.
         """
+        # pytest_generate_tests already ran this during collection; the repo and scenarios are still in place
+        if hasattr(cls, "scenarios"):
+            return
         utils.set_git_identity()  # set a git identity if one doesn't exist
         generator = GeneratorT()
         versions = generator.versions
         generator.generate_list_tests()
         scenarios = generator.scenarios
-        test_repo_temp = os.path.join("tests", "test_repo", "temp")
+        test_repo_temp = os.path.join(utils.TEST_REPO_DIR, "temp")
         os.makedirs(test_repo_temp, exist_ok=True)
-        tmpdir = os.path.join(tempfile.gettempdir(), "pre-commit-hooks-testing")
-        tmpdir = os.path.realpath(tmpdir)  # sometimes the temporary directory can be a symlink
+        tmpdir = utils.get_integration_dir()
         os.makedirs(tmpdir, exist_ok=True)
         base_files = ["ok.c", "ok.cpp", "err.c", "err.cpp"]
-        filenames = [os.path.join("tests", "test_repo", f) for f in base_files]
+        filenames = [os.path.join(utils.TEST_REPO_DIR, f) for f in base_files]
         utils.set_compilation_db(filenames)
         temp_filenames = [os.path.join(tmpdir, f) for f in base_files]
         utils.set_compilation_db(temp_filenames)
         cls.scenarios = []
+        shell_test_name = cls.run_shell_cmd.__name__
+        integration_test_name = cls.run_integration_test.__name__
         for s in scenarios:
-            desc = " ".join([cls.run_shell_cmd.__name__, s[0].command, " ".join(s[2]), " ".join(s[1])])
+            desc = f"{shell_test_name} {s[0].command} {' '.join(s[2])} {' '.join(s[1])}"
             if os.name == "nt":
                 s[2] = [arg.replace("/", "\\\\") for arg in s[2]]
             test_scenario = [
@@ -331,24 +348,25 @@ class TestHooks:
                     "expd_output": s[3],
                     "expd_retcode": s[4],
                 },
+                cls.get_marks(s[0].command, versions),
             ]
             cls.scenarios += [test_scenario]
-        table_tests_integration = os.path.join("tests", "table_tests_integration.json")
+        table_tests_integration = os.path.join(utils.TESTS_DIR, "table_tests_integration.json")
         with open(table_tests_integration) as f:
             json_str = f.read()
         table_tests = json.loads(json_str)
         # initialize repo
+        # `pre-commit run` doesn't need the git hook installed, only the config and a repo
         utils.run_in(["git", "init"], tmpdir)
-        utils.run_in(["pre-commit", "install"], tmpdir)
         for s in table_tests:
-            s["args"] = [arg.replace("{repo_dir}", os.getcwd()) for arg in s["args"]]
+            s["args"] = [arg.replace("{repo_dir}", utils.REPO_ROOT) for arg in s["args"]]
             s["files"] = [arg.replace("{test_dir}", tmpdir) for arg in s["files"]]
             s["expd_output"] = s["expd_output"].replace("{test_dir}", tmpdir)
 
             if os.name == "nt":
                 s["files"] = [arg.replace("/", "\\\\") for arg in s["files"]]
             # After 20, oclint versions use double dash args
-            elif s["command"] == "oclint":
+            elif s["command"] == "oclint" and "oclint" in versions:
                 s["expd_output"] = s["expd_output"].replace("{oclint_ver}", versions["oclint"])
                 if versions["oclint"] >= "20":
                     s["args"] = [arg.replace("-enable", "--enable") for arg in s["args"]]
@@ -356,9 +374,7 @@ class TestHooks:
                         s["args"].remove("-no-analytics")
                     # https after version 20 instead of http
                     s["expd_output"] = s["expd_output"].replace("http://oclint.org", "https://oclint.org")
-            desc = " ".join(
-                [cls.run_integration_test.__name__, s["command"] + "-hook", " ".join(s["files"]), " ".join(s["args"])]
-            )
+            desc = f"{integration_test_name} {s['command']}-hook {' '.join(s['files'])} {' '.join(s['args'])}"
             test_scenario = [
                 desc,
                 {
@@ -370,16 +386,29 @@ class TestHooks:
                     "expd_output": s["expd_output"].encode(),
                     "expd_retcode": s["expd_retcode"],
                 },
+                cls.get_marks(s["command"], versions, integration=True),
             ]
             cls.scenarios += [test_scenario]
 
+    @staticmethod
+    def get_marks(cmd_name, versions, integration=False):
+        """oclint is much slower than the other commands, so its scenarios only run with `-m oclint`.
+        Integration scenarios run pre-commit in a shared git repo and can be deselected with
+        `-m "not integration and not oclint"` (a later -m replaces the default `-m "not oclint"`).
+        Scenarios for tools that aren't installed are skipped."""
+        marks = []
+        if cmd_name not in versions:
+            marks.append(pytest.mark.skip(reason=f"{cmd_name} is not installed"))
+        if cmd_name == "oclint":
+            marks.append(pytest.mark.oclint)
+        if integration:
+            marks.append(pytest.mark.integration)
+        return marks
+
     @staticmethod
     def determine_edit_in_place(cmd_name, args):
         """runtime means to check if cmd/args will edit files"""
-        clang_format_in_place = cmd_name == "clang-format" and "-i" in args
-        clang_tidy_in_place = cmd_name == "clang-tidy" and ("-fix" in args or "--fix-errors" in args)
-        uncrustify_in_place = cmd_name == "uncrustify" and "--replace" in args
-        return clang_format_in_place or clang_tidy_in_place or uncrustify_in_place
+        return not EDIT_IN_PLACE_ARGS.get(cmd_name, frozenset()).isdisjoint(args)
 
     def test_run(self, test_type, cmd_name, args, files, test_dir, expd_output, expd_retcode):
         """Test each command's class from its python file
@@ -400,7 +429,7 @@ class TestHooks:
 
         1. Convert arg lists to .pre-commit-config.yaml text
         2. Set the .pre-commit-config.yaml in a directory with test files
-        3. Run `git init; pre-commit install; git add .; git commit` against the files
+        3. Run `git add` and `pre-commit run` against the files
         """
         output_actual, actual_returncode = utils.integration_test(cmd_name, files, args, test_dir)
         if output_actual == b"":
@@ -422,7 +451,7 @@ class TestHooks:
             expd_output = output_actual.decode().replace("/tmp/pre-commit-testing", "{test_dir}")
             new_test = {
                 "command": command,
-                "files": [f.replace(os.getcwd(), "") for f in files],
+                "files": [f.replace(utils.REPO_ROOT, "") for f in files],
                 "args": args,
                 "expd_output": expd_output,
                 "expd_retcode": target_retcode,
@@ -437,12 +466,14 @@ class TestHooks:
         """Use command generated by setup.py and installed by pip
         Ex. oclint => oclint-hook for the hook command"""
         all_args = files + args
-        cmd_to_run = [cmd_name + "-hook", *all_args]
-        sp_child = sp.run(cmd_to_run, stdout=sp.PIPE, stderr=sp.PIPE)
+        cmd_to_run = [utils.get_hook_path(cmd_name), *all_args]
+        # close_fds=False lets subprocess use posix_spawn instead of fork+exec where available.
+        # Our own fds are non-inheritable (PEP 446), so the hook doesn't see anything extra.
+        sp_child = utils.run_bounded(cmd_to_run, stdout=sp.PIPE, stderr=sp.PIPE, close_fds=False)
         actual = sp_child.stdout + sp_child.stderr
         # Output is unpredictable and platform/version dependent
         if any([f.endswith("err.cpp") for f in files]) and "-std=c++20" in args:
-            actual = re.sub(rb"[\d,]+ warnings and ", b"", actual)
+            actual = utils.WARNING_COUNT_RE.sub(b"", actual)
         retcode = sp_child.returncode
         utils.assert_equal(target_output, actual)
         assert target_retcode == retcode
@@ -450,8 +481,9 @@ class TestHooks:
     @staticmethod
     def teardown_class():
         """Delete files generated by these tests."""
-        test_repo_dir = os.path.join("tests", "test_repo")
-        generated_files = [os.path.join(test_repo_dir, f) for f in ["ok.plist", "err.plist"]]
+        generated_files = [os.path.join(utils.TEST_REPO_DIR, f) for f in ["ok.plist", "err.plist"]]
         for filename in generated_files:
-            if os.path.exists(filename):
+            try:
                 os.remove(filename)
+            except FileNotFoundError:
+                pass
@@ -1,19 +1,46 @@
 #!/usr/bin/env python3
 import difflib
+import functools
+import json
 import os
 import re
 import shutil
 import subprocess as sp
 import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import pytest
 
+# Resolved from this file so the suite doesn't depend on pytest being run from the repo root
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(TESTS_DIR)
+TEST_REPO_DIR = os.path.join(TESTS_DIR, "test_repo")
+
 test_file_strs = {
     "ok.c": '// Copyright 2021 Ross Jacobs\n#include <stdio.h>\n\nint main() {\n  printf("Hello World!\\n");\n  return 0;\n}\n',
     "ok.cpp": '// Copyright 2021 Ross Jacobs\n#include <iostream>\n\nint main() {\n  std::cout << "Hello World!\\n";\n  return 0;\n}\n',
     "err.c": "#include <stdio.h>\nint main(){int i;return;}",
     "err.cpp": "#include <string>\nint main(){int i;return;}",
 }
+# pre-commit prints these when it first sets up a hook environment
+PRE_COMMIT_INFO_RE = re.compile(rb"\[(?:INFO|WARNING)\].*\n")
+# clang-tidy's warning count for c++20 varies by platform and version
+WARNING_COUNT_RE = re.compile(rb"[\d,]+ warnings and ")
+# Regex for all versions. Unit tests: https://regex101.com/r/rzJE0I/1
+VERSION_RE = re.compile(r"[- ]((?:\d+\.)+\d+[_+\-a-z\d]*)(?![\s\S]*OCLint version)")
+PRE_COMMIT_CONFIG_TEMPLATE = """\
+repos:
+- repo: https://github.com/pocc/pre-commit-hooks
+  rev: v1.3.4
+  hooks:
+    - id: {cmd_name}
+      args: {args}
+"""
+# Hooks, git and cmake finish in seconds on the small test files
+SUBPROCESS_TIMEOUT = 60
+# Generous, as pre-commit may need to build a hook environment on first run
+PRE_COMMIT_TIMEOUT = 600
 
 
 def assert_equal(expected: bytes, actual: bytes):
@@ -26,33 +53,71 @@ def assert_equal(expected: bytes, actual: bytes):
             expected_str = expected.decode()
             actual_str = actual.decode()
             print("String comparison:", expected_str == actual_str)
-            diff_lines_gen = difflib.context_diff(expected_str, actual_str, "Expected", "Actual")
-            diff_lines = "".join(list(diff_lines_gen))
+            expected_lines = expected_str.splitlines(keepends=True)
+            actual_lines = actual_str.splitlines(keepends=True)
+            diff_lines = "".join(difflib.unified_diff(expected_lines, actual_lines, "Expected", "Actual"))
             print(f"\n\nDifference:\n{diff_lines}")
         else:
             print(f"Expected is type {type(expected)}\nActual is type {type(actual)}")
         pytest.fail("Test failed!")
 
 
+def get_integration_dir():
+    """Directory for the git repo that integration tests run pre-commit in.
+    Each pytest-xdist worker gets its own so that workers don't share git state."""
+    dirname = "pre-commit-hooks-testing"
+    worker = os.environ.get("PYTEST_XDIST_WORKER")
+    if worker:
+        dirname += "-" + worker
+    # sometimes the temporary directory can be a symlink
+    return os.path.realpath(os.path.join(tempfile.gettempdir(), dirname))
+
+
+@functools.lru_cache(maxsize=None)
+def get_hook_path(cmd_name):
+    """Resolve the pip-installed `$cmd-hook` once instead of searching PATH on every run."""
+    hook_name = cmd_name + "-hook"
+    return shutil.which(hook_name) or hook_name
+
+
+def probe_version(cmd):
+    """Run `cmd --version`, returning None if it hangs."""
+    try:
+        return sp.run([cmd, "--version"], stdout=sp.PIPE, stderr=sp.PIPE, timeout=SUBPROCESS_TIMEOUT)
+    except sp.TimeoutExpired:
+        return None
+
+
+@functools.lru_cache(maxsize=None)
 def get_versions():
-    """Returns a dict of commands and their versions."""
+    """Returns a dict of commands and their versions. Commands that aren't installed are left out, unless CI is set.
+    Cached, as both test_hooks and test_versions need it and each probe spawns every tool."""
     commands = ["clang-format", "clang-tidy", "uncrustify", "cppcheck", "cpplint"]
     if os.name != "nt":  # oclint doesn't work on windows, iwyu needs to be compiled on windows
         commands += ["oclint", "include-what-you-use"]
-    # Regex for all versions. Unit tests: https://regex101.com/r/rzJE0I/1
-    regex = r"[- ]((?:\d+\.)+\d+[_+\-a-z\d]*)(?![\s\S]*OCLint version)"
-    versions = {}
+    installed = []
     for cmd in commands:
-        if not shutil.which(cmd):
-            sys.exit("Command " + cmd + " not found.")
-        cmds = [cmd, "--version"]
-        child = sp.run(cmds, stdout=sp.PIPE, stderr=sp.PIPE)
+        if shutil.which(cmd):
+            installed.append(cmd)
+        elif os.environ.get("CI"):
+            # CI installs every tool, so a missing one is a broken install rather than a reason to skip
+            sys.exit(f"Command {cmd} not found.")
+        else:
+            print(f"Command {cmd} not found. Skipping its tests.")
+    # Probes are independent and mostly wait on process startup, so run them together
+    with ThreadPoolExecutor() as executor:
+        children = executor.map(probe_version, installed)
+    versions = {}
+    for cmd, child in zip(installed, children):
+        if child is None:
+            print(f"`{cmd} --version` did not finish within {SUBPROCESS_TIMEOUT}s")
+            sys.exit(1)
         if len(child.stderr) > 0:
-            print(f"Received error when running {cmds}:\n{child.stderr}")
+            print(f"Received error when running {child.args}:\n{child.stderr}")
             sys.exit(1)
         output = child.stdout.decode("utf-8")
         try:
-            versions[cmd] = re.search(regex, output).group(1)
+            versions[cmd] = VERSION_RE.search(output).group(1)
         except AttributeError:
             print(f"Received `{output}`. Version regexes have broken.")
             print("Please file a bug (github.com/pocc/pre-commit-hooks).")
@@ -63,40 +128,45 @@ def get_versions():
 # Required for testing with clang-tidy and oclint
 def set_compilation_db(filenames):
     """Create a compilation database for clang static analyzers."""
-    cdb = "["
     clang_location = shutil.which("clang")
+    if os.name == "nt" and clang_location:  # Required for clang-tidy
+        clang_location = clang_location.replace("Program Files", 'Program" "Files')
     file_dir = os.path.dirname(os.path.abspath(filenames[0]))
+    cdb = []
     for f in filenames:
-        file_base = os.path.basename(f)
-        clang_suffix = ""
-        if f.endswith("cpp"):
-            clang_suffix = "++"
-        cdb += """\n{{
-    "directory": "{0}",
-    "command": "{1}{2} {3} -o {3}.o",
-    "file": "{3}"
-}},""".format(
-            file_dir, clang_location, clang_suffix, os.path.join(file_dir, file_base)
+        file_path = os.path.join(file_dir, os.path.basename(f))
+        clang_suffix = "++" if f.endswith("cpp") else ""
+        cdb.append(
+            {
+                "directory": file_dir,
+                "command": f"{clang_location}{clang_suffix} {file_path} -o {file_path}.o",
+                "file": file_path,
+            }
         )
-    cdb = cdb[:-1] + "]"  # Subtract extra comma and end json
-    # Required for clang-tidy
-    if os.name == "nt":
-        cdb = cdb.replace("\\", "\\\\").replace("Program Files", 'Program\\" \\"Files')
     with open(os.path.join(file_dir, "compile_commands.json"), "w") as f:
-        f.write(cdb)
+        json.dump(cdb, f, indent=4)
 
 
 def set_git_identity():
     """Set a git identity if one does not exist."""
-    sp_child = sp.run(["git", "config", "--list"], stdout=sp.PIPE)
-    if "user.name" not in sp_child.stdout.decode() or "user.email" not in sp_child.stdout.decode():
+    # `git config --get` exits non-zero when the key is unset
+    keys = ["user.name", "user.email"]
+    if any(sp.run(["git", "config", "--get", key], stdout=sp.DEVNULL).returncode != 0 for key in keys):
         sp.run(["git", "config", "--global", "user.name", "Test Runner"])
         sp.run(["git", "config", "--global", "user.email", "test@example.com"])
         sp.run(["git", "config", "--global", "init.defaultbranch", "master"])
 
 
+def run_bounded(commands, timeout=SUBPROCESS_TIMEOUT, **kwargs) -> sp.CompletedProcess:
+    """Run a test subprocess, failing the test instead of hanging if it never exits."""
+    try:
+        return sp.run(commands, timeout=timeout, **kwargs)
+    except sp.TimeoutExpired:
+        pytest.fail(f"commands {commands} did not finish within {timeout}s")
+
+
 def run_in(commands, tmpdir):
-    sp_child = sp.run(commands, cwd=tmpdir, stdout=sp.PIPE, stderr=sp.PIPE)
+    sp_child = run_bounded(commands, cwd=tmpdir, stdout=sp.PIPE, stderr=sp.PIPE)
     if sp_child.returncode != 0:
         err_msg = (
             f"commands {commands} failed with\nstdout: {sp_child.stdout.decode()}stderr: {sp_child.stderr.decode()}\n"
@@ -104,36 +174,49 @@ def run_in(commands, tmpdir):
         pytest.fail(err_msg)
 
 
+def write_test_file(filename, contents):
+    """Write a test file unless it already has the expected contents.
+    Only tests that edit in place change the source files, so most runs can skip the write."""
+    if os.path.exists(filename):
+        with open(filename) as f:
+            if f.read() == contents:
+                return
+    with open(filename, "w") as f:
+        f.write(contents)
+
+
+def run_hook_inproc(cmd_class, argv, capsysbinary):
+    """Run a hook's command class in this process instead of spawning its `$cmd-hook` script.
+    Hooks always end with sys.exit, so return its exit code along with the captured (out, err) bytes."""
+    with pytest.raises(SystemExit) as exc:
+        cmd_class(argv).run()
+    return exc.value.code, capsysbinary.readouterr()
+
+
 def integration_test(cmd_name, files, args, test_dir):
+    if shutil.which("pre-commit") is None:
+        pytest.skip("pre-commit is not installed")
     for test_file in files:
         test_file_base = os.path.split(test_file)[-1]
         if test_file_base in test_file_strs:
-            with open(test_file, "w") as fd:
-                fd.write(test_file_strs[test_file_base])
+            write_test_file(test_file, test_file_strs[test_file_base])
     # Add only the files we are testing
     run_in(["git", "reset"], test_dir)
     run_in(["git", "add"] + files, test_dir)
-    args = list(args)  # redeclare so there's no memory weirdness
     pre_commit_config_path = os.path.join(test_dir, ".pre-commit-config.yaml")
-    pre_commit_config = f"""\
-repos:
-- repo: https://github.com/pocc/pre-commit-hooks
-  rev: v1.3.4
-  hooks:
-    - id: {cmd_name}
-      args: {args}
-"""
-    with open(pre_commit_config_path, "w") as f:
-        f.write(pre_commit_config)
+    # A JSON list is a valid YAML flow sequence, and unlike repr() it escapes backslashes in Windows paths
+    pre_commit_config = PRE_COMMIT_CONFIG_TEMPLATE.format(cmd_name=cmd_name, args=json.dumps(args))
+    # Consecutive scenarios for the same hook and args leave the config as is
+    write_test_file(pre_commit_config_path, pre_commit_config)
 
     # Pre-commit run will only work on staged files, which is what we want to test
     # Using git commit can cause hangs if pre-commit passes
-    sp_child = sp.run(["pre-commit", "run"], cwd=test_dir, stdout=sp.PIPE, stderr=sp.PIPE)
+    sp_child = run_bounded(["pre-commit", "run"], PRE_COMMIT_TIMEOUT, cwd=test_dir, stdout=sp.PIPE, stderr=sp.PIPE)
     output_actual = sp_child.stderr + sp_child.stdout
     # Get rid of pre-commit first run info lines
-    output_actual = re.sub(rb"\[(?:INFO|WARNING)\].*\n", b"", output_actual)
+    output_actual = PRE_COMMIT_INFO_RE.sub(b"", output_actual)
     # Output is unpredictable and platform/version dependent
     if any([f.endswith("err.cpp") for f in files]) and "-std=c++20" in args:
-        output_actual = re.sub(rb"[\d,]+ warnings and ", b"", output_actual)
+        output_actual = WARNING_COUNT_RE.sub(b"", output_actual)
 
     return output_actual, sp_child.returncode
@@ -1,7 +1,8 @@
 #!/usr/bin/env python
 """Test that --version works for each hook correctly"""
 import os
-import subprocess as sp
+
+import pytest
 
 import tests.test_utils as utils
 from hooks.clang_format import ClangFormatCmd
@@ -38,6 +39,12 @@ Edit your pre-commit config or use a different version of {0}.
             commands.append(OCLintCmd)
             commands.append(IncludeWhatYouUseCmd)
         for cmd in commands:
+            if cmd.command not in cls.versions:
+                # Keep a visible placeholder so a missing tool shows up as skipped in the report
+                missing = pytest.mark.skip(reason=f"{cmd.command} is not installed")
+                args = {"cmd_class": cmd, "version": "", "expected_stderr": b"", "expected_retcode": 0}
+                scenarios += [[f"(missing) {cmd.command}", args, [missing]]]
+                continue
             actual_ver = cls.versions[cmd.command]
             err_str = cls.err_str.format(cmd.command, cls.err_ver, actual_ver).encode()
             # Removing last char ~= having actual version be $ver-beta or $ver.5
@@ -58,10 +65,8 @@ Edit your pre-commit config or use a different version of {0}.
         return scenarios
 
     @staticmethod
-    def test_version(cmd_class, version, expected_stderr, expected_retcode):
+    def test_version(cmd_class, version, expected_stderr, expected_retcode, capsysbinary):
         args = [cmd_class.command + "-hook", "--version", version]
-        sp_child = sp.run(args, stdout=sp.PIPE, stderr=sp.PIPE)
-        actual_stderr = sp_child.stderr
-        actual_retcode = sp_child.returncode
-        utils.assert_equal(actual_stderr, expected_stderr)
+        actual_retcode, output = utils.run_hook_inproc(cmd_class, args, capsysbinary)
+        utils.assert_equal(expected_stderr, output.err)
         assert actual_retcode == expected_retcode